@@ -25,8 +25,6 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
-from subprocess import run
-
 import pkg.libs.Variables as var
 
 from pkg.libs.Core import Core
@@ -39,10 +37,11 @@ class Main:
     @classmethod
     def start(cls):
         Tools.ProcessArguments(Modules)
-        run(["clear"], check=False)
+        Tools.Exec(["clear"])
         Tools.PrintHeader()
         Core.LoadSettings()
         Core.AddFilesAfterSettingsLoaded()
+        Core.FreezeHooks()
         Core.SetAndCheckDesiredKernel()
         Core.VerifySupportedArchitecture()
         Tools.Clean()
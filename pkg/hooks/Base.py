@@ -28,10 +28,7 @@ from pkg.libs.Tools import Tools
 
 
 class Base(Hook):
-    @classmethod
-    def GetKmodLinks(cls):
-        return cls._kmod_links
+    __slots__ = ()
 
-    @classmethod
-    def GetUdevProvider(cls):
-        return cls._udev_provider
+    kmodLinks = []
+    udevProvider = ""
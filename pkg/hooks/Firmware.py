@@ -27,7 +27,7 @@ from pkg.hooks.Hook import Hook
 
 
 class Firmware(Hook):
-    @classmethod
-    def IsCopyAllEnabled(cls):
-        """Returns if we should copy all firmware into the initramfs."""
-        return cls._copy_all
+    __slots__ = ()
+
+    # Whether we should copy all firmware into the initramfs.
+    copyAll = False
@@ -23,82 +23,119 @@
 # OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
 # SUCH DAMAGE.
 
+import sys
+
 from pkg.libs.Tools import Tools
 
+_fail = Tools.Fail
+_ERR = 'The file "{}" was not found on the list!'.format
+_FROZEN = 'The "{}" hook can no longer be modified!'.format
+
+
+class HookMeta(type):
+    """Sets up the state of every hook when its class is created and keeps
+       track of all the hooks that have been defined.
+    """
+
+    registry = []
+
+    def __init__(cls, name, bases, namespace, **kwargs):
+        super().__init__(name, bases, namespace, **kwargs)
+
+        # Every hook gets its own state so that hooks don't end up sharing
+        # (and mutating) the same lists through the base class.
+        cls.use = False
+        cls.useMan = False
 
-class Hook:
-    _use = 0
-    _use_man = 0
-    _files = []
-    _optional_files = []
-    _directories = []
-    _man = []
+        # The collections are dicts used as ordered sets. Entries are
+        # de-duplicated and removals are O(1), while the insertion order
+        # (which matters for the module load order) is kept.
+        cls.files = {}
+        cls.optionalFiles = {}
+        cls.directories = {}
+        cls.manFiles = {}
+
+        # Formatted output of PrintFiles, rebuilt whenever 'files' changes.
+        cls._print_cache = None
+
+        if bases:
+            HookMeta.registry.append(cls)
+
+
+class Hook(metaclass=HookMeta):
+    # Hooks are never instantiated. Their state lives on the class and is
+    # read directly by the callers (i.e: Zfs.files).
+    __slots__ = ()
 
     @classmethod
     def Enable(cls):
         """Enables this hook."""
-        cls._use = 1
+        cls.use = True
 
     @classmethod
     def Disable(cls):
         """Disables this hook."""
-        cls._use = 0
+        cls.use = False
 
     @classmethod
     def EnableMan(cls):
         """Enables copying the man pages."""
-        cls._use_man = 1
+        cls.useMan = True
 
     @classmethod
     def DisableMan(cls):
         """Disables copying the man pages."""
-        cls._use_man = 0
+        cls.useMan = False
 
     @classmethod
-    def IsEnabled(cls):
-        """Returns whether this hook is activated."""
-        return cls._use
+    def Freeze(cls):
+        """Locks the hook's collections once the hook has been configured."""
+        cls.files = tuple(cls.files)
+        cls.optionalFiles = tuple(cls.optionalFiles)
+        cls.directories = tuple(cls.directories)
+        cls.manFiles = tuple(cls.manFiles)
+        cls._print_cache = None
 
     @classmethod
-    def IsManEnabled(cls):
-        """Returns whether man pages will be copied."""
-        return cls._use_man
+    def IsFrozen(cls):
+        """Returns whether the hook's collections have been locked."""
+        return isinstance(cls.files, tuple)
 
     @classmethod
     def AddFile(cls, vFile):
         """Adds a required file to the hook to be copied into the initramfs."""
-        cls._files.append(vFile)
+        if cls.IsFrozen():
+            _fail(_FROZEN(cls.__name__))
+
+        cls.files[vFile] = None
+        cls._print_cache = None
+
+    @classmethod
+    def AddFiles(cls, vFiles):
+        """Adds multiple required files to the hook in one go."""
+        if cls.IsFrozen():
+            _fail(_FROZEN(cls.__name__))
+
+        cls.files.update(dict.fromkeys(vFiles))
+        cls._print_cache = None
 
     @classmethod
     def RemoveFile(cls, vFile):
         """Deletes a required file from the hook."""
-        try:
-            cls._files.remove(vFile)
-        except ValueError:
-            Tools.Fail('The file "' + vFile + '" was not found on the list!')
+        if cls.IsFrozen():
+            _fail(_FROZEN(cls.__name__))
 
-    @classmethod
-    def PrintFiles(cls):
-        """Prints the required files in this hook."""
-        for file in cls.GetFiles():
-            print("File: " + file)
+        if vFile not in cls.files:
+            _fail(_ERR(vFile))
 
-    @classmethod
-    def GetFiles(cls):
-        """Returns the list of required files."""
-        return cls._files
+        del cls.files[vFile]
 
-    @classmethod
-    def GetOptionalFiles(cls):
-        """Returns the list of optional files."""
-        return cls._optional_files
+        cls._print_cache = None
 
     @classmethod
-    def GetDirectories(cls):
-        """Returns the list of required directories."""
-        return cls._directories
+    def PrintFiles(cls):
+        """Prints the required files in this hook."""
+        if cls._print_cache is None:
+            cls._print_cache = "".join(f"File: {file}\n" for file in cls.files)
 
-    @classmethod
-    def GetManPages(cls):
-        """Returns the list of man page files for this hook."""
-        return cls._man
+        sys.stdout.write(cls._print_cache)
@@ -27,4 +27,4 @@ from pkg.hooks.Hook import Hook
 
 
 class Modules(Hook):
-    pass
+    __slots__ = ()
@@ -25,28 +25,37 @@
 
 import os
 import re
+import shutil
 
-from subprocess import run, check_output
-from subprocess import CalledProcessError
+from concurrent.futures import ThreadPoolExecutor
+from glob import glob
+
+from subprocess import run, PIPE
 
 import pkg.libs.Variables as var
 
 from pkg.libs.Tools import Tools
 
+from pkg.hooks.Hook import HookMeta
 from pkg.hooks.Base import Base
 from pkg.hooks.Zfs import Zfs
 from pkg.hooks.Modules import Modules
 from pkg.hooks.Firmware import Firmware
 
+# Extracts the module name from a module path (i.e: .../zfs.ko.xz -> zfs)
+_KO_RE = re.compile(r"(?<=/)[a-zA-Z0-9_-]+(?=\.ko)")
+
 
 class Core:
     """Contains the core of the application"""
 
-    # List of binaries (That will be 'ldd'ed later)
-    _binset = set()
+    # List of binaries (That will be 'ldd'ed later). Duplicates are
+    # only dropped once the list is consumed.
+    _binset = []
 
-    # List of modules that will be compressed
-    _modset = set()
+    # List of modules that will be compressed. Duplicates are only
+    # dropped once the list is consumed.
+    _modset = []
 
     # Enable the 'base' hook since all initramfs will have this
     Base.Enable()
@@ -67,9 +76,9 @@ class Core:
         settings = Tools.LoadSettings()
 
         # Base
-        Base._files = settings["base"]["files"]
-        Base._kmod_links = settings["base"]["kmodLinks"]
-        Base._udev_provider = settings["base"]["udevProvider"]
+        Base.AddFiles(settings["base"]["files"])
+        Base.kmodLinks = settings["base"]["kmodLinks"]
+        Base.udevProvider = settings["base"]["udevProvider"]
 
         # Modules
 
@@ -78,15 +87,15 @@ class Core:
 
         # Example: To enable nvme and i915 you would have the following
         # modules in your settings.json: [nvme", "i915"]
-        Modules._files = settings["modules"]["files"]
+        Modules.AddFiles(settings["modules"]["files"])
 
         # ZFS
 
         # Required Files
-        Zfs._files = settings["zfs"]["files"]
+        Zfs.AddFiles(settings["zfs"]["files"])
 
         # Optional Files. Will not fail if we fail to copy them.
-        Zfs._optional_files = settings["zfs"]["optionalFiles"]
+        Zfs.optionalFiles = dict.fromkeys(settings["zfs"]["optionalFiles"])
 
         # Man Pages. Not used for actual initramfs environment
         # since the initramfs doesn't have the applications required to
@@ -94,28 +103,28 @@ class Core:
         # these are used by the 'sysresccd-moddat' scripts to generate
         # the sysresccd + zfs isos.
         # Should we copy the man pages?
-        Zfs._use_man = settings["zfs"]["useMan"]
+        Zfs.useMan = bool(settings["zfs"]["useMan"])
 
         # Note: Portage allows one to change the compression type with
         # PORTAGE_COMPRESS. In this situation, these files will have
         # a different extension. The user should adjust these if needed.
-        Zfs._man = settings["zfs"]["manFiles"]
+        Zfs.manFiles = dict.fromkeys(settings["zfs"]["manFiles"])
 
         # Firmware
 
         # Copy firmware?
-        Firmware._use = settings["firmware"]["use"]
+        Firmware.use = bool(settings["firmware"]["use"])
 
         # If enabled, all the firmware in /lib/firmware will be copied into the initramfs.
         # If you know exactly what firmware files you want, definitely leave this at 0 so
         # to reduce the initramfs size.
-        Firmware._copy_all = settings["firmware"]["copyAll"]
+        Firmware.copyAll = bool(settings["firmware"]["copyAll"])
 
         # A list of firmware files to include in the initramfs
-        Firmware._files = settings["firmware"]["files"]
+        Firmware.AddFiles(settings["firmware"]["files"])
 
         # A list of firmware directories to include in the initramfs
-        Firmware._directories = settings["firmware"]["directories"]
+        Firmware.directories = dict.fromkeys(settings["firmware"]["directories"])
 
         # Variables
         var.bin = settings["systemDirectory"]["bin"]
@@ -144,18 +153,27 @@ class Core:
         # The udev provider is also part of the base required files. However,
         # we are simplifying it to only one entry in the json so that if the
         # user's provider defers, they only need to change it in one place.
-        Base.AddFile(Base.GetUdevProvider())
+        Base.AddFile(Base.udevProvider)
 
         # Add the required ZFS module
         Modules.AddFile("zfs")
 
+    @classmethod
+    def FreezeHooks(cls):
+        """Locks the hooks' file lists before we start copying them."""
+        for hook in HookMeta.registry:
+            hook.Freeze()
+
     @classmethod
     def CreateBaselayout(cls):
         """Creates the base directory structure."""
         Tools.Info("Creating temporary directory at " + var.temp + " ...")
 
+        # os.makedirs creates the parent directories for us, so only the
+        # deepest directories need to be created (i.e: /etc/zfs covers /etc).
         for dir in var.baselayout:
-            run(["mkdir", "-p", dir], check=False)
+            if not any(other.startswith(dir + "/") for other in var.baselayout):
+                os.makedirs(dir, exist_ok=True)
 
     @classmethod
     def SetAndCheckDesiredKernel(cls):
@@ -188,8 +206,7 @@ class Core:
 
         # If the required binaries don't exist, then exit
         for binary in var.preliminaryBinaries:
-            if not os.path.isfile(Tools.GetProgramPath(binary)):
-                Tools.BinaryDoesntExist(binary)
+            Tools.GetProgramPath(binary)
 
     @classmethod
     def GenerateModprobeInfo(cls):
@@ -200,7 +217,7 @@ class Core:
         Tools.Into(var.modules + "/modules.order")
         Tools.Into(var.modules + "/modules.builtin")
 
-        result = run(["depmod", "-b", var.temp, var.kernel], check=False).returncode
+        result = Tools.Exec(["depmod", "-b", var.temp, var.kernel])
 
         if result != 0:
             Tools.Fail(
@@ -210,31 +227,25 @@ class Core:
     @classmethod
     def CopyFirmware(cls):
         """Copies the firmware files/directories if necessary."""
-        if Firmware.IsEnabled():
+        if Firmware.use:
             Tools.Info("Copying firmware...")
 
             if os.path.isdir(var.firmwareDirectory):
-                if Firmware.IsCopyAllEnabled():
+                if Firmware.copyAll:
                     Tools.CopyTree(
                         var.firmwareDirectory, var.temp + var.firmwareDirectory
                     )
                 else:
                     # Copy the firmware files
-                    if Firmware.GetFiles():
-                        try:
-                            for fw in Firmware.GetFiles():
-                                Tools.Into(fw, directoryPrefix=var.firmwareDirectory)
-                        except FileNotFoundError:
-                            Tools.Warn(
-                                "An error occurred while copying the following firmware file: {}".format(
-                                    fw
-                                )
-                            )
+                    if Firmware.files:
+                        Tools.BatchCopy(
+                            Firmware.files, directoryPrefix=var.firmwareDirectory
+                        )
 
                     # Copy the firmware directories
-                    if Firmware.GetDirectories():
+                    if Firmware.directories:
                         try:
-                            for fw in Firmware.GetDirectories():
+                            for fw in Firmware.directories:
                                 sourceFirmwareDirectory = os.path.join(
                                     var.firmwareDirectory, fw
                                 )
@@ -264,30 +275,48 @@ class Core:
         # Needs to be from this directory so that the links are relative
         os.chdir(var.GetTempBinDir())
 
-        # Create busybox links
-        cmd = (
-            "chroot "
-            + var.temp
-            + ' /bin/busybox sh -c "cd /bin && /bin/busybox --install -s ."'
+        # Create busybox links. This is the equivalent of running
+        # 'busybox --install -s /bin' inside of the initramfs, without
+        # having to chroot into it. Existing files are left untouched.
+        result = run(
+            [var.temp + "/bin/busybox", "--list"],
+            stdout=PIPE,
+            universal_newlines=True,
+            check=False,
         )
-        callResult = run(cmd, shell=True, check=False).returncode
 
-        if callResult != 0:
-            Tools.Fail("Unable to create busybox links via chroot!")
+        if result.returncode != 0:
+            Tools.Fail("Unable to retrieve the list of busybox applets!")
+
+        for applet in result.stdout.split():
+            try:
+                os.symlink("busybox", applet)
+            except FileExistsError:
+                pass
 
         # Create 'sh' symlink to 'bash'
         os.remove(var.temp + "/bin/sh")
         os.symlink("bash", "sh")
 
-        # Switch to the kmod directory, delete the corresponding busybox
-        # symlink and create the symlinks pointing to kmod
+        # If kmod isn't in the initramfs, there is nothing to link to. Keep
+        # the busybox versions of the module utilities in that case.
         if os.path.isfile(var.GetTempSbinDir() + "/kmod"):
-            os.chdir(var.GetTempSbinDir())
+            kmodDirectory = var.GetTempSbinDir()
         elif os.path.isfile(var.GetTempBinDir() + "/kmod"):
-            os.chdir(var.GetTempBinDir())
+            kmodDirectory = var.GetTempBinDir()
+        else:
+            return
+
+        # Switch to the kmod directory, delete the corresponding busybox
+        # symlink and create the symlinks pointing to kmod
+        os.chdir(kmodDirectory)
+
+        for link in Base.kmodLinks:
+            try:
+                os.remove(var.temp + "/bin/" + link)
+            except FileNotFoundError:
+                pass
 
-        for link in Base.GetKmodLinks():
-            os.remove(var.temp + "/bin/" + link)
             os.symlink("kmod", link)
 
     @classmethod
@@ -312,25 +341,37 @@ class Core:
 
     @classmethod
     def _FindAndCreateLinks(cls, sourceDirectory, targetDirectory):
-        pcmd = (
-            "find "
-            + sourceDirectory
-            + ' -iname "*.so.*" -exec ln -sf "{}" '
-            + targetDirectory
-            + " ;"
-        )
-        cmd = f'chroot {var.temp} /bin/busybox sh -c "{pcmd}"'
-        run(cmd, shell=True, check=False)
-
-        pcmd = (
-            "find "
-            + sourceDirectory
-            + ' -iname "*.so" -exec ln -sf "{}" '
-            + targetDirectory
-            + " ;"
-        )
-        cmd = f'chroot {var.temp} /bin/busybox sh -c "{pcmd}"'
-        run(cmd, shell=True, check=False)
+        """Links every library found under the source directory into the
+           target directory. Same as running the following two commands inside
+           of the initramfs:
+           find <source> -iname "*.so.*" -exec ln -sf {} <target> ;
+           find <source> -iname "*.so" -exec ln -sf {} <target> ;
+        """
+        tempTargetDirectory = var.temp + targetDirectory
+
+        for root, dirs, files in os.walk(var.temp + sourceDirectory):
+            for name in dirs + files:
+                lowerName = name.lower()
+
+                if ".so." not in lowerName and not lowerName.endswith(".so"):
+                    continue
+
+                # The links point to the library's path inside of the initramfs
+                library = os.path.join(root[len(var.temp) :], name)
+                link = os.path.join(tempTargetDirectory, name)
+
+                # Don't replace a library with a link to itself
+                if os.path.normpath(var.temp + library) == os.path.normpath(link):
+                    continue
+
+                try:
+                    os.remove(link)
+                except FileNotFoundError:
+                    pass
+                except IsADirectoryError:
+                    continue
+
+                os.symlink(library, link)
 
     @classmethod
     def _CopyUdevAndDeleteFiles(cls, udevDirectory, udevExcludedFiles):
@@ -354,7 +395,7 @@ class Core:
         cls._CopyUdevAndDeleteFiles(var.udevLibDirectory, var.udevLibExcludedFiles)
 
         # Rename udevd and place in /sbin
-        udevProvider = Base.GetUdevProvider()
+        udevProvider = Base.udevProvider
         providerDir = os.path.dirname(udevProvider)
         tempUdevProvider = var.temp + udevProvider
         sbinUdevd = var.sbin + "/udevd"
@@ -377,7 +418,13 @@ class Core:
     def DumpSystemKeymap(cls):
         """Dumps the current system's keymap."""
         pathToKeymap = var.temp + "/etc/keymap"
-        result = run("dumpkeys > " + pathToKeymap, shell=True, check=False).returncode
+
+        try:
+            with open(pathToKeymap, "wb") as keymap:
+                result = run(["dumpkeys"], stdout=keymap, check=False).returncode
+        except FileNotFoundError:
+            # dumpkeys isn't installed
+            result = 1
 
         if result != 0 or not os.path.isfile(pathToKeymap):
             Tools.Warn(
@@ -392,7 +439,7 @@ class Core:
         Tools.Info("Performing finishing steps ...")
 
         # Create mtab file
-        run(["touch", var.temp + "/etc/mtab"], check=False)
+        open(var.temp + "/etc/mtab", "a").close()
 
         if not os.path.isfile(var.temp + "/etc/mtab"):
             Tools.Fail("Error creating the mtab file. Exiting.")
@@ -403,14 +450,14 @@ class Core:
         Tools.SafeCopy(var.filesDirectory + "/init", var.temp)
 
         # Give execute permissions to the script
-        cr = run(["chmod", "u+x", var.temp + "/init"], check=False).returncode
+        cr = Tools.Exec(["chmod", "u+x", var.temp + "/init"])
 
         if cr != 0:
             Tools.Fail("Failed to give executive privileges to " + var.temp + "/init")
 
         # Sets initramfs script version number
-        cmd = f"echo {var.version} > {var.temp}/version.bliss"
-        run(cmd, shell=True, check=False)
+        with open(var.temp + "/version.bliss", "w") as versionFile:
+            versionFile.write(var.version + "\n")
 
         # Copy all of the modprobe configurations
         if os.path.isdir(var.modprobeDirectory):
@@ -422,9 +469,9 @@ class Core:
         # Any last substitutions or additions/modifications should be done here
 
         # Add any modules needed into the initramfs
-        requiredModules = ",".join(Modules.GetFiles())
-        cmd = f"echo {requiredModules} > {var.temp}/modules.bliss"
-        run(cmd, shell=True, check=False)
+        requiredModules = ",".join(Modules.files)
+        with open(var.temp + "/modules.bliss", "w") as modulesFile:
+            modulesFile.write(requiredModules + "\n")
 
         cls.CopyLibGccLibrary()
 
@@ -437,21 +484,20 @@ class Core:
         libgccFilename = "libgcc_s.so"
         libgccFilenameMain = libgccFilename + ".1"
 
-        # check for gcc-config
-        gccConfigPath = Tools.GetProgramPath("gcc-config")
+        # check for gcc-config (exits if it isn't installed)
+        Tools.GetProgramPath("gcc-config")
 
-        if gccConfigPath:
-            # Try gcc-config
-            cmd = "gcc-config -L | cut -d ':' -f 1"
-            res = Tools.Run(cmd)
+        # Try gcc-config. The first entry of the first line is the
+        # directory that the active gcc's libraries are in.
+        res = Tools.Run(["gcc-config", "-L"])
 
-            if res:
-                # Use path from gcc-config
-                libgccPath = res[0] + "/" + libgccFilenameMain
-                Tools.SafeCopy(libgccPath, var.GetTempLib64Dir())
-                os.chdir(var.GetTempLib64Dir())
-                os.symlink(libgccFilenameMain, libgccFilename)
-                return
+        if res:
+            # Use path from gcc-config
+            libgccPath = res[0].split(":")[0] + "/" + libgccFilenameMain
+            Tools.SafeCopy(libgccPath, var.GetTempLib64Dir())
+            os.chdir(var.GetTempLib64Dir())
+            os.symlink(libgccFilenameMain, libgccFilename)
+            return
 
         # Doing a 'whereis <name of libgcc library>' will not work because it seems
         # that it finds libraries in /lib, /lib64, /usr/lib, /usr/lib64, but not in
@@ -474,9 +520,15 @@ class Core:
         # the ${T} path.
         os.chdir(var.temp)
 
+        # pigz is a drop-in replacement for gzip that compresses using all
+        # of the available cores. Use it if it's installed.
+        compressor = "pigz" if shutil.which("pigz") else "gzip"
+
         run(
             [
-                "find . -print0 | cpio -o --null --format=newc | gzip -9 > "
+                "find . -print0 | cpio -o --null --format=newc | "
+                + compressor
+                + " -9 > "
                 + var.home
                 + "/"
                 + var.initrd
@@ -494,10 +546,10 @@ class Core:
         Tools.Info("Checking required files ...")
 
         # Check required base files
-        cls.VerifyBinariesExist(Base.GetFiles())
+        cls.VerifyBinariesExist(Base.files)
 
         # Check required zfs files
-        cls.VerifyBinariesExist(Zfs.GetFiles())
+        cls.VerifyBinariesExist(Zfs.files)
 
     @classmethod
     def VerifyBinariesExist(cls, vFiles):
@@ -511,16 +563,16 @@ class Core:
         """Copies the required files into the initramfs."""
         Tools.Info("Copying binaries ...")
 
-        cls.FilterAndInstall(Base.GetFiles())
-        cls.FilterAndInstall(Zfs.GetFiles())
-        cls.FilterAndInstall(Zfs.GetOptionalFiles(), dontFail=True)
+        cls.FilterAndInstall(Base.files)
+        cls.FilterAndInstall(Zfs.files)
+        cls.FilterAndInstall(Zfs.optionalFiles, dontFail=True)
 
     @classmethod
     def CopyManPages(cls):
         """Copies the man pages."""
-        if Zfs.IsManEnabled():
+        if Zfs.useMan:
             Tools.Info("Copying man pages ...")
-            cls.CopyMan(Zfs.GetManPages())
+            cls.CopyMan(Zfs.manFiles)
 
     @classmethod
     def CopyMan(cls, files):
@@ -530,31 +582,22 @@ class Core:
         # some manual pages that the initramfs wants to copy might not
         # have yet been written. Therefore, attempt to copy the man pages,
         # but if we are unable to copy, then just continue.
-        for f in files:
-            Tools.Into(f, dontFail=True)
+        Tools.BatchCopy(files, dontFail=True)
 
     @classmethod
     def FilterAndInstall(cls, vFiles, **optionalArgs):
         """Filters and installs each file in the array into the initramfs.
 
             Optional Args:
-                dontFail - Same description as the one in Tools.Copy.
+                dontFail - Same description as the one in Tools.BatchCopy.
         """
         for file in vFiles:
-            # If the application is a binary, add it to our binary set. If the application is not
-            # a binary, then we will get a CalledProcessError because the output will be null.
-            try:
-                check_output(
-                    "file -L " + file.strip() + ' | grep "linked"',
-                    shell=True,
-                    universal_newlines=True,
-                ).strip()
-                cls._binset.add(file)
-            except CalledProcessError:
-                pass
+            # If the application is a binary, add it to our binary set.
+            if Tools.IsLinkedBinary(file.strip()):
+                cls._binset.append(file)
 
-            # Copy the file into the initramfs
-            Tools.Into(file, dontFail=optionalArgs.get("dontFail", False))
+        # Copy the files into the initramfs
+        Tools.BatchCopy(vFiles, dontFail=optionalArgs.get("dontFail", False))
 
     @classmethod
     def CopyModules(cls):
@@ -564,27 +607,33 @@ class Core:
         # Build the list of module dependencies
         Tools.Info("Copying modules ...")
 
+        # Index the modules directory once (module name -> path) rather than
+        # searching through it for every module. Compressed modules
+        # (i.e: zfs.ko.xz) are indexed under their module name as well.
+        availableModules = {}
+
+        for root, dirs, files in os.walk(var.modules):
+            for name in files:
+                moduleName, ko, extension = name.rpartition(".ko")
+
+                if ko and (not extension or extension.startswith(".")):
+                    availableModules.setdefault(
+                        moduleName.lower(), os.path.join(root, name)
+                    )
+
         # Checks to see if all the modules in the list exist (if any)
-        for file in Modules.GetFiles():
+        for file in Modules.files:
             Tools.Flag("Module: {}".format(file))
-            try:
-                cmd = (
-                    "find "
-                    + var.modules
-                    + ' -iname "'
-                    + file
-                    + '.ko*" | grep '
-                    + file
-                    + ".ko"
-                )
-                result = check_output(cmd, universal_newlines=True, shell=True).strip()
-                cls._modset.add(result)
-            except CalledProcessError:
+            result = availableModules.get(file.lower())
+
+            if not result:
                 Tools.ModuleDoesntExist(file)
 
+            cls._modset.append(result)
+
         # Try to update the module dependencies database before searching it
         try:
-            result = run(["depmod", var.kernel], check=False).returncode
+            result = Tools.Exec(["depmod", var.kernel])
 
             if result:
                 Tools.Fail("Error updating module dependency database!")
@@ -595,31 +644,58 @@ class Core:
             # to the 'depmod' command.
             Tools.Fail("The 'depmod' command wasn't found.")
 
-        # Get the dependencies for all the modules in our set
-        for file in cls._modset:
-            # Get only the name of the module
-            match = re.search("(?<=/)[a-zA-Z0-9_-]+.ko", file)
+        # Get only the names of the modules
+        moduleNames = []
+
+        for file in set(cls._modset):
+            match = _KO_RE.search(file)
 
             if match:
-                sFile = match.group().split(".")[0]
-                cmd = (
-                    "modprobe -S "
-                    + var.kernel
-                    + " --show-depends "
-                    + sFile
-                    + " | awk -F ' ' '{print $2}'"
+                moduleNames.append(match.group())
+
+        # Get the dependencies for all the modules in our set with a single
+        # modprobe call. Every module that needs to be loaded (dependencies
+        # included) shows up as an "insmod <path>" line. Built-in modules
+        # show up as "builtin <name>" and have nothing to copy.
+        if moduleNames:
+            try:
+                result = run(
+                    [
+                        "modprobe",
+                        "-S",
+                        var.kernel,
+                        "--show-depends",
+                        "-a",
+                        *moduleNames,
+                    ],
+                    stdout=PIPE,
+                    stderr=PIPE,
+                    universal_newlines=True,
+                    check=False,
                 )
-                results = check_output(cmd, shell=True, universal_newlines=True).strip()
+            except FileNotFoundError:
+                Tools.Fail("The 'modprobe' command wasn't found.")
 
-                for i in results.split("\n"):
-                    moddeps.add(i.strip())
+            # A module that can't be resolved would otherwise silently be
+            # left out of the initramfs, so don't continue without it.
+            if result.returncode != 0:
+                for line in result.stderr.splitlines():
+                    Tools.Warn(line)
+
+                Tools.Fail(
+                    "Unable to resolve the dependencies for the following modules: "
+                    + ", ".join(moduleNames)
+                )
+
+            for line in result.stdout.split("\n"):
+                if line.startswith("insmod "):
+                    moddeps.add(line.split()[1])
 
         # Copy the modules/dependencies
         if not moddeps:
             return
 
-        for module in moddeps:
-            Tools.Into(module)
+        Tools.BatchCopy(moddeps)
 
         # Update module dependency database inside the initramfs
         cls.GenerateModprobeInfo()
@@ -639,46 +715,52 @@ class Core:
         libc_found = False
 
         for libc in possible_libc_paths:
-            try:
-                # (Dirty implementation) Use the exit code of grep with no messages being outputed to see if this interpreter exists.
-                # We don't know the name yet which is why we are using the wildcard in the variable declaration.
-                result = run("grep -Uqs thiswillnevermatch " + libc, shell=True, check=False).returncode
-
-                # 0 = match found
-                # 1 = file exists but not found
-                # 2 = file doesn't exist
-                # In situations 0 or 1, we are good, since we just care that the file exists.
-                if result != 0 and result != 1:
-                    continue
-
-                # Get the interpreter name that is on this system
-                result = check_output(
-                    "ls " + libc, shell=True, universal_newlines=True
-                ).strip()
+            # We don't know the exact name of the interpreter on this system
+            # which is why we are using a wildcard in the paths above.
+            interpreters = glob(libc)
 
-                # Add intepreter to deps since everything will depend on it
-                bindeps.add(result)
+            # Add intepreter to deps since everything will depend on it
+            if interpreters:
+                bindeps.update(interpreters)
                 libc_found = True
-            except Exception as e:
-                pass
 
         if not libc_found:
             Tools.Fail("No libc interpreters were found!")
 
         # Get the dependencies for the binaries we've collected and add them to
         # our bindeps set. These will all be copied into the initramfs later.
-        for binary in cls._binset:
-            cmd = (
-                "ldd "
-                + binary
-                + " 2>&1 | grep -v 'not a dynamic executable' | awk -F '=>' '{print $2}' | awk -F ' ' '{print $1}' | sed '/^ *$/d'"
-            )
-            results = check_output(cmd, shell=True, universal_newlines=True).strip()
+        # The ldd calls are independent of each other, so run them in parallel.
+        binaries = set(cls._binset)
 
-            if results:
-                for library in results.split("\n"):
-                    bindeps.add(library)
+        # A missing 'ldd' surfaces here, re-raised by executor.map from
+        # whichever worker hit it first.
+        try:
+            with ThreadPoolExecutor() as executor:
+                for libraries in executor.map(cls._GetLibraryDependencies, binaries):
+                    bindeps.update(libraries)
+        except FileNotFoundError:
+            Tools.Fail("The 'ldd' command wasn't found.")
 
         # Copy all the dependencies of the binary files into the initramfs
-        for library in bindeps:
-            Tools.Into(library)
+        Tools.BatchCopy(bindeps)
+
+    @classmethod
+    def _GetLibraryDependencies(cls, binary):
+        """Returns the set of libraries that the binary is linked against."""
+        libraries = set()
+
+        results = run(
+            ["ldd", binary], capture_output=True, universal_newlines=True, check=False
+        ).stdout
+
+        # Only the "libfoo.so.1 => /lib64/libfoo.so.1 (0x...)" lines point
+        # to a library that we need. Static binaries, the vdso and the
+        # interpreter line don't have a "=>" in them.
+        for line in results.split("\n"):
+            if "=>" in line:
+                library = line.split("=>", 1)[1].split()
+
+                if library:
+                    libraries.add(library[0])
+
+        return libraries
@@ -24,22 +24,60 @@
 # SUCH DAMAGE.
 
 import os
+import sys
 import json
+import stat
+import shutil
 import argparse
 
 import pkg.libs.Variables as var
 
+from functools import lru_cache
 from subprocess import call
-from subprocess import check_output
+from subprocess import run
+from subprocess import PIPE
+from subprocess import CalledProcessError
+
+# orjson parses the settings quite a bit faster than the json module
+# but isn't required. We'll fall back to the json module if it's missing.
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class Tools:
     """Contains various tools/utilities that are used throughout the app."""
 
+    # Directories that we've already created inside of the initramfs
+    _created_directories = set()
+
+    # Parsed settings files, keyed by (path, modification time, size)
+    _settings_cache = {}
+
+    # Terminal color codes used by Colorize
+    _colors = {
+        "red": "\033[1;31m",
+        "yellow": "\033[1;33m",
+        "green": "\033[1;32m",
+        "cyan": "\033[1;36m",
+        "purple": "\033[1;34m",
+        "white": "\033[1;37m",
+        "pink": "\033[1;35m",
+    }
+    _color_reset = "\033[0;m"
+
+    # Colored prefixes of the message functions, built once
+    _info_prefix = _colors["green"] + "[*] " + _color_reset
+    _warn_prefix = _colors["yellow"] + "[!] " + _color_reset
+    _flag_prefix = _colors["purple"] + "[+] " + _color_reset
+    _option_prefix = _colors["cyan"] + "[>] " + _color_reset
+    _fail_prefix = _colors["red"] + "[#] " + _color_reset
+
     # Checks parameters and running user
     @classmethod
     def ProcessArguments(cls, Modules):
-        user = Tools.Run("whoami")[0]
+        user = Tools.Run(["whoami"])[0]
 
         if user != "root":
             cls.Fail("This program must be ran as root")
@@ -77,24 +115,32 @@ class Tools:
     @classmethod
     def PrintHeader(cls):
         """Prints the header of the application."""
-        print("-" * 30)
-        Tools.Print(
+        header = [
+            "-" * 30,
             Tools.Colorize("yellow", var.name)
             + " - "
-            + Tools.Colorize("pink", "v" + var.version)
-        )
-        Tools.Print(var.contact)
-        Tools.Print(var.license)
-        print("-" * 30 + "\n")
+            + Tools.Colorize("pink", "v" + var.version),
+            var.contact,
+            var.license,
+            "-" * 30,
+            "",
+        ]
+
+        # Print the whole header at once
+        Tools.Print("\n".join(header))
 
     @classmethod
+    @lru_cache(maxsize=None)
     def GetProgramPath(cls, vProg):
-        """Finds the path to a program on the system."""
-        cmd = "whereis " + vProg + ' | cut -d " " -f 2'
-        results = check_output(cmd, shell=True, universal_newlines=True).strip()
+        """Finds the path to a program on the system. The result is cached
+           since the programs won't move around while we are running.
+        """
+        # Like 'whereis', only the program name matters. Any leading
+        # directory (i.e '/bin/cpio') is ignored and the PATH is searched.
+        path = shutil.which(os.path.basename(vProg))
 
-        if results:
-            return results
+        if path:
+            return path
         else:
             cls.Fail("The " + vProg + " program could not be found!")
 
@@ -107,11 +153,16 @@ class Tools:
         # completely sure that there will be no inteference cleaning up.
         os.chdir(var.home)
 
-        # Removes the temporary directory
+        # Anything we've created so far is about to be deleted
+        cls._created_directories.clear()
+
+        # Removes the temporary directory. We don't go through RemoveTree
+        # since it uses Fail, which calls us. rm's exit code tells us
+        # whether the removal worked, so no need to check again afterwards.
         if os.path.exists(var.temp):
-            Tools.RemoveTree(var.temp)
+            result = call(["rm", "-rf", var.temp])
 
-            if os.path.exists(var.temp):
+            if result != 0:
                 cls.Warn("Failed to delete the " + var.temp + " directory. Exiting.")
                 quit(1)
 
@@ -134,34 +185,21 @@ class Tools:
         # it will be used below.
         directoryPrefix = optionalArgs.get("directoryPrefix", None)
 
-        # Check to see if a file with this name exists before copying,
-        # if it exists, delete it, then copy. If a directory, create the directory
-        # before copying.
         if directoryPrefix:
-            path = var.temp + "/" + directoryPrefix + "/" + vFile
-            targetFile = directoryPrefix + "/" + vFile
+            path = f"{var.temp}/{directoryPrefix}/{vFile}"
+            targetFile = f"{directoryPrefix}/{vFile}"
         else:
-            path = var.temp + "/" + vFile
+            path = f"{var.temp}/{vFile}"
             targetFile = vFile
 
-        if os.path.exists(path):
-            if os.path.isfile(path):
-                os.remove(path)
-                Tools.Copy(targetFile, path)
-        else:
-            if os.path.isfile(targetFile):
-                # Make sure that the directory that this file wants to be in
-                # exists, if not then create it.
-                if os.path.isdir(os.path.dirname(path)):
-                    Tools.Copy(targetFile, path)
-                else:
-                    os.makedirs(os.path.dirname(path))
-                    Tools.Copy(targetFile, path)
-            elif os.path.isdir(targetFile):
-                os.makedirs(path)
+        # Make sure that the file exists before copying (unless declared otherwise).
+        # A single stat tells us both if it exists and if it's a regular file.
+        try:
+            targetFileMode = os.stat(targetFile).st_mode
+        except FileNotFoundError:
+            targetFileMode = 0
 
-        # Finally lets make sure that the file was copied to its destination (unless declared otherwise)
-        if not os.path.isfile(path):
+        if not stat.S_ISREG(targetFileMode):
             message = "Unable to copy " + targetFile
 
             if optionalArgs.get("dontFail", False):
@@ -169,23 +207,122 @@ class Tools:
             else:
                 cls.Fail(message)
 
+            return
+
+        # Make sure that the directory that this file wants to be in
+        # exists, if not then create it. Many files share the same
+        # directory so remember the ones we've already created.
+        directory = os.path.dirname(path)
+
+        if directory not in cls._created_directories:
+            os.makedirs(directory, exist_ok=True)
+            cls._created_directories.add(directory)
+
+        # If the file was already copied before, delete it, then copy.
+        # Copy will fail for us if 'cp' wasn't able to copy the file.
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        Tools.Copy(targetFile, path)
+
+    @classmethod
+    def BatchCopy(cls, vFiles, **optionalArgs):
+        """Copies a group of files into the initramfs in a few batched 'cp' calls.
+
+            The files keep their full path inside of the initramfs, just like
+            they would with Into (i.e: /lib64/libc.so.6 -> ${T}/lib64/libc.so.6).
+
+            Optional Args:
+               directoryPrefix = Prefix the files are relative to (same as in Into)
+               dontFail = If a file wasn't able to be copied, do not fail.
+        """
+        directoryPrefix = optionalArgs.get("directoryPrefix", None)
+        dontFail = optionalArgs.get("dontFail", False)
+        sources = []
+
+        for vFile in vFiles:
+            if directoryPrefix:
+                sourceFile = directoryPrefix + "/" + vFile
+            else:
+                sourceFile = vFile
+
+            if os.path.isfile(sourceFile):
+                sources.append(vFile)
+            else:
+                message = "Unable to copy " + sourceFile
+
+                if dontFail:
+                    cls.Warn(message)
+                else:
+                    cls.Fail(message)
+
+        if not sources:
+            return
+
+        # Files relative to a prefix are copied from inside of the prefix
+        # so that only their relative path is recreated under ${T}/<prefix>.
+        if directoryPrefix:
+            targetDirectory = var.temp + "/" + directoryPrefix
+        else:
+            targetDirectory = var.temp
+
+        # Create the directories that the files will land in beforehand. The
+        # copies run in parallel below and 'cp --parents' doesn't handle two
+        # processes trying to create the same directory at the same time.
+        for vFile in sources:
+            directory = os.path.normpath(targetDirectory + "/" + os.path.dirname(vFile))
+
+            if directory not in cls._created_directories:
+                os.makedirs(directory, exist_ok=True)
+                cls._created_directories.add(directory)
+
+        # Feed the files through xargs so that we only fork 'cp' once per
+        # batch of files rather than once per file. The batches are copied
+        # in parallel since most of the time is spent waiting on I/O.
+        result = run(
+            [
+                "xargs",
+                "-0",
+                "-n",
+                "64",
+                "-P",
+                str(os.cpu_count() or 1),
+                "cp",
+                "--reflink=auto",
+                "--parents",
+                "-t",
+                targetDirectory,
+                "--",
+            ],
+            input="\0".join(sources),
+            cwd=directoryPrefix,
+            universal_newlines=True,
+            check=False,
+        ).returncode
+
+        if result != 0:
+            message = "An error occurred while copying files into " + targetDirectory
+
+            if dontFail:
+                cls.Warn(message)
+            else:
+                cls.Fail(message)
+
     @classmethod
     def SafeCopy(cls, sourceFile, targetDest, *desiredName):
         """Copies a file to a target path and checks to see that it exists."""
         if len(desiredName) == 0:
-            splitResults = sourceFile.split("/")
-            lastPosition = len(splitResults)
-            sourceFileName = splitResults[lastPosition - 1]
+            sourceFileName = os.path.basename(sourceFile)
         else:
             sourceFileName = desiredName[0]
 
-        targetFile = targetDest + "/" + sourceFileName
+        targetFile = os.path.join(targetDest, sourceFileName)
 
+        # Copy will fail for us if 'cp' wasn't able to create the file
         if os.path.exists(sourceFile):
             Tools.Copy(sourceFile, targetFile)
-
-            if not os.path.isfile(targetFile):
-                Tools.Fail('Error creating the "' + sourceFileName + '" file. Exiting.')
         else:
             Tools.Fail("The source file doesn't exist: " + sourceFile)
 
@@ -204,7 +341,10 @@ class Tools:
                 "Copy: The following file/directory doesn't exist: {}".format(source)
             )
 
-        cmd = "cp "
+        # Let 'cp' clone the data on filesystems with reflink support
+        # (btrfs, xfs, ...) rather than copying every byte. This matters most
+        # for whole trees (i.e: /lib/firmware). It falls back to a regular copy.
+        cmd = "cp --reflink=auto "
 
         if recursive:
             cmd += "-r "
@@ -265,19 +405,50 @@ class Tools:
             )
 
     @classmethod
-    def Run(cls, command):
-        """Runs a shell command and returns its output."""
+    def IsLinkedBinary(cls, vFile):
+        """Returns whether the file is an ELF executable or shared object,
+           which is what 'file -L' would report as being "linked".
+        """
+        try:
+            with open(vFile, "rb") as f:
+                header = f.read(18)
+        except OSError:
+            return False
+
+        if len(header) < 18 or header[:4] != b"\x7fELF":
+            return False
+
+        # e_ident[EI_DATA] tells us the byte order of the e_type field
+        byteorder = "big" if header[5] == 2 else "little"
+
+        # ET_EXEC = 2, ET_DYN = 3
+        return int.from_bytes(header[16:18], byteorder) in (2, 3)
+
+    @classmethod
+    def Run(cls, argv, *, check=True):
+        """Runs a command (given as a list of arguments, no shell involved)
+           and returns its output lines.
+        """
         try:
             return (
-                check_output(command, universal_newlines=True, shell=True)
-                .strip()
+                run(argv, stdout=PIPE, universal_newlines=True, check=check)
+                .stdout.strip()
                 .split("\n")
             )
-        except:
+        except (CalledProcessError, FileNotFoundError):
             Tools.Fail(
-                "An error occurred while processing the following command: " + command
+                "An error occurred while processing the following command: "
+                + " ".join(argv)
             )
 
+    @classmethod
+    def Exec(cls, argv):
+        """Runs a command (given as a list of arguments, no shell involved)
+           with its output going straight to the terminal and returns its
+           exit code. Use this when the output isn't needed.
+        """
+        return run(argv, check=False).returncode
+
     @classmethod
     def LoadSettings(cls):
         """Loads the settings.json file and returns it."""
@@ -302,67 +473,71 @@ class Tools:
                     )
                 )
 
-        with open(settingsFile) as settings:
-            return json.load(settings)
+        settingsStat = os.stat(settingsFile)
+        key = (settingsFile, settingsStat.st_mtime_ns, settingsStat.st_size)
+
+        if key not in cls._settings_cache:
+            with open(settingsFile, "rb") as settings:
+                contents = settings.read()
+
+            if orjson:
+                cls._settings_cache[key] = orjson.loads(contents)
+            else:
+                cls._settings_cache[key] = json.loads(contents)
+
+        return cls._settings_cache[key]
 
     ####### Message Functions #######
 
     @classmethod
     def Colorize(cls, vColor, vMessage):
         """Returns the string with a color to be used in bash."""
-        if vColor == "red":
-            coloredMessage = "\033[1;31m" + vMessage + "\033[0;m"
-        elif vColor == "yellow":
-            coloredMessage = "\033[1;33m" + vMessage + "\033[0;m"
-        elif vColor == "green":
-            coloredMessage = "\033[1;32m" + vMessage + "\033[0;m"
-        elif vColor == "cyan":
-            coloredMessage = "\033[1;36m" + vMessage + "\033[0;m"
-        elif vColor == "purple":
-            coloredMessage = "\033[1;34m" + vMessage + "\033[0;m"
-        elif vColor == "white":
-            coloredMessage = "\033[1;37m" + vMessage + "\033[0;m"
-        elif vColor == "pink":
-            coloredMessage = "\033[1;35m" + vMessage + "\033[0;m"
-        elif vColor == "none":
-            coloredMessage = vMessage
-
-        return coloredMessage
+        if vColor == "none":
+            return vMessage
+
+        return cls._colors[vColor] + vMessage + cls._color_reset
 
     @classmethod
     def Print(cls, vMessage):
-        """Prints a message through the shell."""
-        call(["echo", "-e", vMessage])
+        """Prints a message."""
+        print(vMessage, flush=True)
 
     @classmethod
     def Info(cls, vMessage):
         """Used for displaying information."""
-        call(["echo", "-e", cls.Colorize("green", "[*] ") + vMessage])
+        cls.Print(cls._info_prefix + vMessage)
 
     @classmethod
     def Question(cls, vQuestion):
         """ Used for input (questions)."""
-        return input(vQuestion)
+        if sys.stdin.isatty():
+            return input(vQuestion)
+
+        # When input is piped in (i.e: scripted runs) there is no need for
+        # input()'s line editing, so just read the line.
+        sys.stdout.write(vQuestion)
+        sys.stdout.flush()
+        return sys.stdin.readline().rstrip("\n")
 
     @classmethod
     def Warn(cls, vMessage):
         """Used for warnings."""
-        call(["echo", "-e", cls.Colorize("yellow", "[!] ") + vMessage])
+        cls.Print(cls._warn_prefix + vMessage)
 
     @classmethod
     def Flag(cls, vFlag):
         """Used for flags."""
-        call(["echo", "-e", cls.Colorize("purple", "[+] ") + vFlag])
+        cls.Print(cls._flag_prefix + vFlag)
 
     @classmethod
     def Option(cls, vOption):
         """Used for options."""
-        call(["echo", "-e", cls.Colorize("cyan", "[>] ") + vOption])
+        cls.Print(cls._option_prefix + vOption)
 
     @classmethod
     def Fail(cls, vMessage):
         """Used for errors."""
-        cls.Print(cls.Colorize("red", "[#] ") + vMessage)
+        cls.Print(cls._fail_prefix + vMessage)
         cls.NewLine()
         cls.Clean()
         quit(1)
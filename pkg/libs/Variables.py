@@ -24,9 +24,9 @@
 # SUCH DAMAGE.
 
 import os
-import subprocess
 import sys
-import random
+import time
+import platform
 
 """Defines various variables that are used internally for the application.
 
@@ -52,7 +52,8 @@ modules = ""
 lmodules = ""
 initrd = ""
 
-rstring = str(random.randint(100000000, 999999999))
+# Unique suffix for the temporary directory (process id + current time)
+rstring = f"{os.getpid():x}{time.time_ns():x}"
 
 # Temporary directory will now be in 'home' rather than
 # in /tmp since people may have executed their /tmp with 'noexec'
@@ -67,27 +68,30 @@ phome = os.path.dirname(os.path.realpath(sys.argv[0]))
 filesDirectory = phome + "/files"
 
 # CPU Architecture
-arch = subprocess.check_output(["uname", "-m"], universal_newlines=True).strip()
+arch = platform.machine()
 
 # Layout of the initramfs
 baselayout = [
-    temp + "/etc",
-    temp + "/etc/bash",
-    temp + "/etc/zfs",
-    temp + "/dev",
-    temp + "/proc",
-    temp + "/sys",
-    temp + "/mnt",
-    temp + "/mnt/root",
-    temp + "/mnt/key",
-    temp + "/lib",
-    temp + "/lib/modules",
-    temp + "/lib64",
-    temp + "/bin",
-    temp + "/sbin",
-    temp + "/usr",
-    temp + "/root",
-    temp + "/run",
+    f"{temp}{directory}"
+    for directory in (
+        "/etc",
+        "/etc/bash",
+        "/etc/zfs",
+        "/dev",
+        "/proc",
+        "/sys",
+        "/mnt",
+        "/mnt/root",
+        "/mnt/key",
+        "/lib",
+        "/lib/modules",
+        "/lib64",
+        "/bin",
+        "/sbin",
+        "/usr",
+        "/root",
+        "/run",
+    )
 ]
 
 # Temporary Directories (Dynamically Retrieved) since we need